@@ -27,23 +27,45 @@ This tool is private to the sbom() rule.
 
 import argparse
 import datetime
+import functools
 import hashlib
 import json
+import mmap
+
+# pylint: disable=g-import-not-at-top
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+
+@functools.lru_cache(maxsize=None)
+def spdxid_for(pkg: str) -> str:
+  """Returns the stable SPDXID for a package label.
+
+  Args:
+    pkg: a package label from packages_used output.
+
+  Returns:
+    SPDXID string
+  """
+  return "SPDXRef-GooglePackage-" + hashlib.blake2b(
+      pkg.encode("utf-8"), digest_size=16
+  ).hexdigest()
 
 
 # pylint: disable=g-bare-generic
-def create_sbom(package_info: dict, maven_packages: dict) -> dict:
-  """Creates a dict representing an SBOM.
+def sbom_header(package_info: dict) -> dict:
+  """Creates the document level fields of an SBOM.
 
   Args:
     package_info: dict of data from packages_used output.
-    maven_packages: packages gleaned from Maven lock file.
 
   Returns:
-    dict of SBOM data
+    dict of SBOM data, without packages or relationships
   """
   now = datetime.datetime.now(datetime.timezone.utc)
-  ret = {
+  return {
       "spdxVersion": "SPDX-2.3",
       "dataLicense": "CC0-1.0",
       "SPDXID": "SPDXRef-DOCUMENT",
@@ -57,64 +79,162 @@ def create_sbom(package_info: dict, maven_packages: dict) -> dict:
               "Tool: github.com/bazelbuild/bazel/tools/compliance/write_sbom",
               "Organization: Google LLC",
           ],
-          "created": now.isoformat(),
+          "created": (
+              f"{now.year:04d}-{now.month:02d}-{now.day:02d}T"
+              f"{now.hour:02d}:{now.minute:02d}:{now.second:02d}Z"
+          ),
       },
   }
 
-  packages = []
-  relationships = []
 
-  relationships.append({
-      "spdxElementId": "SPDXRef-DOCUMENT",
-      "relatedSpdxElement": "SPDXRef-Package-main",
-      "relationshipType": "DESCRIBES"
-  })
+# pylint: disable=g-bare-generic
+def iter_packages(package_info: dict, maven_packages: dict):
+  """Yields the SBOM package entries, one per package used.
+
+  Args:
+    package_info: dict of data from packages_used output.
+    maven_packages: packages gleaned from Maven lock file.
 
-  # This is bazel private shenanigans.
+  Yields:
+    dict of SPDX package data
+  """
+  # Index the maven packages by every label form we may see them under.
+  # This is bazel private shenanigans. Bazel hacks jvm_external to add
+  # //file:file as a target, then we depend on that rather than the correct
+  # thing. Example: @org_apache_tomcat_tomcat_annotations_api_8_0_5//file:file
   magic_file_suffix = "//file:file"
+  maven_lookup = {}
+  for name, info in (maven_packages or {}).items():
+    maven_lookup["@maven//:" + name] = info
+    maven_lookup["@" + name + magic_file_suffix] = info
 
   for pkg in package_info["packages"]:
-    tmp_id = hashlib.md5()
-    tmp_id.update(pkg.encode("utf-8"))
-    spdxid = "SPDXRef-GooglePackage-%s" % tmp_id.hexdigest()
     pi = {
         "name": pkg,
         "downloadLocation": "NOASSERTION",
-        "SPDXID": spdxid,
+        "SPDXID": spdxid_for(pkg),
         # TODO(aiuto): Fill in the rest
         # "supplier": "Organization: Google LLC",
         # "licenseConcluded": "License-XXXXXX",
         # "copyrightText": ""
     }
 
-    have_maven = None
-    if pkg.startswith("@maven//:"):
-      have_maven = maven_packages.get(pkg[9:])
-    elif pkg.endswith(magic_file_suffix):
-      # Bazel hacks jvm_external to add //file:file as a target, then we depend
-      # on that rather than the correct thing.
-      # Example: @org_apache_tomcat_tomcat_annotations_api_8_0_5//file:file
-      # Check for just the versioned root
-      have_maven = maven_packages.get(pkg[1 : -len(magic_file_suffix)])
-
+    have_maven = maven_lookup.get(pkg)
     if have_maven:
       pi["downloadLocation"] = have_maven["url"]
     else:
       # TODO(aiuto): Do something better for this case.
       print("MISSING ", pkg)
 
-    packages.append(pi)
-    relationships.append({
+    yield pi
+
+
+# pylint: disable=g-bare-generic
+def iter_relationships(package_info: dict):
+  """Yields the SBOM relationship entries.
+
+  Args:
+    package_info: dict of data from packages_used output.
+
+  Yields:
+    dict of SPDX relationship data
+  """
+  yield {
+      "spdxElementId": "SPDXRef-DOCUMENT",
+      "relatedSpdxElement": "SPDXRef-Package-main",
+      "relationshipType": "DESCRIBES"
+  }
+  for pkg in package_info["packages"]:
+    yield {
         "spdxElementId": "SPDXRef-Package-main",
-        "relatedSpdxElement": spdxid,
+        "relatedSpdxElement": spdxid_for(pkg),
         "relationshipType": "CONTAINS",
-    })
+    }
+
+
+# pylint: disable=g-bare-generic
+def create_sbom(package_info: dict, maven_packages: dict) -> dict:
+  """Creates a dict representing an SBOM.
+
+  Args:
+    package_info: dict of data from packages_used output.
+    maven_packages: packages gleaned from Maven lock file.
 
-  ret["packages"] = packages
-  ret["relationships"] = relationships
+  Returns:
+    dict of SBOM data
+  """
+  ret = sbom_header(package_info)
+  ret["packages"] = list(iter_packages(package_info, maven_packages))
+  ret["relationships"] = list(iter_relationships(package_info))
   return ret
 
 
+# pylint: disable=g-bare-generic
+def write_sbom(out, package_info: dict, maven_packages: dict) -> None:
+  """Writes an SBOM as JSON, one package or relationship at a time.
+
+  The output is byte for byte what json_dumps(create_sbom(...)) would
+  produce, but the full document is never held in memory.
+
+  Args:
+    out: binary file object to write to.
+    package_info: dict of data from packages_used output.
+    maven_packages: packages gleaned from Maven lock file.
+  """
+  # Drop the closing "\n}" so we can append the arrays to the header.
+  out.write(json_dumps(sbom_header(package_info))[:-2])
+  _write_json_array(
+      out, "packages", iter_packages(package_info, maven_packages)
+  )
+  _write_json_array(out, "relationships", iter_relationships(package_info))
+  out.write(b"\n}")
+
+
+def _write_json_array(out, key: str, items) -> None:
+  """Writes ',\n  "key": [...]' with the same layout as json_dumps."""
+  out.write(b',\n  ' + json_dumps(key) + b': [')
+  sep = b"\n    "
+  for item in items:
+    # Items sit two levels deep, so every line of each one shifts right.
+    out.write(sep + json_dumps(item).replace(b"\n", b"\n    "))
+    sep = b",\n    "
+  out.write(b"]" if sep == b"\n    " else b"\n  ]")
+
+
+def load_json_file(path: str):
+  """Parses a JSON file, using orjson when it is available.
+
+  The file is memory mapped so orjson can decode straight from the page
+  cache rather than from a second copy read into the heap.
+
+  Args:
+    path: path to the JSON file
+
+  Returns:
+    the decoded object
+  """
+  with open(path, "rb") as inp:
+    with mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      if orjson:
+        with memoryview(mm) as view:
+          return orjson.loads(view)
+      return json.loads(mm[:])
+
+
+def json_dumps(obj) -> bytes:
+  """Serializes obj as indented, UTF-8 encoded JSON.
+
+  Args:
+    obj: a JSON serializable object
+
+  Returns:
+    the encoded document
+  """
+  if orjson:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+  return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+
+
 def maven_to_bazel(s):
   """Returns a string with maven separators mapped to what we use in Bazel.
 
@@ -210,20 +330,17 @@ def main() -> None:
   )
   opts = parser.parse_args()
 
-  with open(opts.packages_used, "rt", encoding="utf-8") as inp:
-    package_info = json.loads(inp.read())
+  package_info = load_json_file(opts.packages_used)
 
   maven_packages = None
   if opts.maven_install:
-    with open(opts.maven_install, "rt", encoding="utf-8") as inp:
-      maven_install = json.loads(inp.read())
-      maven_packages = maven_install_to_packages(maven_install)
-      # Useful for debugging
-      # print(json.dumps(maven_packages, indent=2))
-
-  sbom = create_sbom(package_info, maven_packages)
-  with open(opts.out, "w", encoding="utf-8") as out:
-    out.write(json.dumps(sbom, indent=2))
+    maven_install = load_json_file(opts.maven_install)
+    maven_packages = maven_install_to_packages(maven_install)
+    # Useful for debugging
+    # print(json.dumps(maven_packages, indent=2))
+
+  with open(opts.out, "wb") as out:
+    write_sbom(out, package_info, maven_packages)
 
 
 if __name__ == "__main__":